@@ -9,12 +9,157 @@ then generates an interactive HTML debugging diagram.
 import os
 import re
 import json
+import shutil
+import hashlib
 import argparse
 from pathlib import Path
 from typing import Dict, List, Set, Optional
 from dataclasses import dataclass, field
 
 BASE_DIR = Path("/Users/daniel/Documents/Mad")
+CACHE_DIR = BASE_DIR / ".architecture-cache"
+_SRC = str(BASE_DIR / "src")
+
+# Static scan tables, one tuple per known node
+_KEY_COMPONENTS = (
+    ("Dashboard", "Dashboard.tsx", "Main dashboard view with sync status and navigation"),
+    ("SyncStatusIndicator", "dashboard/SyncStatusIndicator.tsx", "Shows sync progress for contacts, emails, messages"),
+    ("ConversationList", "ConversationList/index.tsx", "Displays email and message conversations"),
+    ("Contacts", "Contacts.tsx", "Contact management view"),
+    ("Login", "Login.tsx", "Google OAuth login screen"),
+    ("MicrosoftLogin", "MicrosoftLogin.tsx", "Microsoft OAuth login screen"),
+    ("AuditTransactionModal", "AuditTransactionModal.tsx", "Transaction audit dialog"),
+    ("OnboardingFlow", "OnboardingFlow.tsx", "Multi-step onboarding sequence"),
+)
+
+_KEY_HOOKS = (
+    ("useAppStateMachine", "useAppStateMachine.ts", "Central state orchestrator for app lifecycle", "src/appCore/state"),
+    ("useSyncQueue", "useSyncQueue.ts", "React hook for SyncQueueService subscription", "src/hooks"),
+    ("useAutoRefresh", "useAutoRefresh.ts", "Triggers sync operations on dashboard open", "src/hooks"),
+    ("useIPhoneSync", "useIPhoneSync.ts", "Manages iPhone device detection and sync", "src/hooks"),
+    ("useConversations", "useConversations.ts", "Loads and manages message conversations", "src/hooks"),
+    ("useMacOSMessagesImport", "useMacOSMessagesImport.ts", "macOS Messages.app import", "src/hooks"),
+    ("useAuditTransaction", "useAuditTransaction.ts", "Transaction audit workflow", "src/hooks"),
+)
+
+_KEY_FRONTEND_SERVICES = (
+    ("SyncQueueService", "SyncQueueService.ts", "Singleton tracking sync state with completion detection"),
+    ("authService", "authService.ts", "Wraps authentication IPC calls"),
+    ("transactionService", "transactionService.ts", "Wraps transaction IPC calls"),
+    ("contactService", "contactService.ts", "Wraps contact IPC calls"),
+    ("deviceService", "deviceService.ts", "Device detection and iPhone sync"),
+    ("licenseService", "licenseService.ts", "License validation"),
+)
+
+_IPC_BRIDGES = (
+    ("syncBridge", "window.api.sync", "iPhone sync operations"),
+    ("transactionBridge", "window.api.transactions", "Scan, CRUD, export"),
+    ("contactBridge", "window.api.contacts", "Contact operations"),
+    ("messageBridge", "window.api.messages", "macOS iMessage import"),
+    ("authBridge", "window.api.auth", "OAuth login/logout"),
+    ("outlookBridge", "window.api.outlook", "Outlook email operations"),
+    ("deviceBridge", "window.api.device", "Device detection"),
+    ("llmBridge", "window.api.llm", "LLM configuration"),
+)
+
+_KEY_HANDLERS = (
+    ("syncHandlers", "sync-handlers.ts", "Handles sync:start, sync:cancel, sync:getStatus"),
+    ("transactionHandlers", "transaction-handlers.ts", "Handles transactions:scan, CRUD operations"),
+    ("contactHandlers", "contact-handlers.ts", "Handles contacts:getAll, link, sync"),
+    ("messageHandlers", "handlers/messageImportHandlers.ts", "Handles messages:importMacOSMessages"),
+    ("authHandlers", "auth-handlers.ts", "Handles OAuth login for Google/Microsoft"),
+    ("deviceHandlers", "device-handlers.ts", "Handles device detection"),
+    ("llmHandlers", "llm-handlers.ts", "Handles LLM configuration"),
+)
+
+_KEY_BACKEND_SERVICES = (
+    ("syncOrchestrator", "syncOrchestrator.ts", "Orchestrates full iPhone sync pipeline"),
+    ("gmailFetchService", "gmailFetchService.ts", "Fetches emails from Gmail API with rate limiting"),
+    ("outlookFetchService", "outlookFetchService.ts", "Fetches emails from Microsoft Graph API"),
+    ("deviceDetectionService", "deviceDetectionService.ts", "Detects connected iPhones via libimobiledevice"),
+    ("backupService", "backupService.ts", "Creates encrypted iPhone backups via idevicebackup2"),
+    ("iOSMessagesParser", "iOSMessagesParser.ts", "Extracts SMS/iMessage from iPhone backup"),
+    ("macOSMessagesImport", "macOSMessagesImportService.ts", "Reads macOS Messages.app database directly"),
+    ("iPhoneSyncStorage", "iPhoneSyncStorageService.ts", "Persists sync results to local database"),
+    ("databaseService", "databaseService.ts", "SQLite facade with SQLCipher encryption"),
+    ("supabaseService", "supabaseService.ts", "Cloud sync operations"),
+    ("tokenEncryptionService", "tokenEncryptionService.ts", "OAuth token encryption via safeStorage"),
+)
+
+_STORAGE_NODES = (
+    ("sqlite", "SQLite + SQLCipher", "Local encrypted database", "Encrypted local DB. Tables: users, contacts, messages, transactions"),
+    ("supabase", "Supabase", "Cloud database", "User profiles, devices, API quotas. RLS enforced."),
+    ("gmailApi", "Gmail API", "External API", "Gmail API via OAuth 2.0. Scopes: mail.readonly"),
+    ("graphApi", "MS Graph API", "External API", "Microsoft Graph API. Scopes: Mail.Read"),
+    ("libimobiledevice", "libimobiledevice", "Native library", "iPhone communication via USB"),
+)
+
+# Known relationships (source -> targets)
+_CONNECTIONS = {
+    # Components -> Hooks
+    'Dashboard': ('useSyncQueue', 'useAutoRefresh', 'SyncStatusIndicator'),
+    'SyncStatusIndicator': ('useSyncQueue',),
+    'ConversationList': ('useConversations',),
+    'Contacts': ('contactService', 'contactBridge'),
+    'Login': ('authService',),
+    'MicrosoftLogin': ('authService',),
+
+    # Hooks -> Services/Bridges
+    'useAppStateMachine': ('useAutoRefresh', 'authService'),
+    'useSyncQueue': ('SyncQueueService',),
+    'useAutoRefresh': ('SyncQueueService', 'transactionBridge', 'messageBridge', 'contactBridge'),
+    'useIPhoneSync': ('syncBridge',),
+    'useConversations': ('messageBridge',),
+    'useMacOSMessagesImport': ('messageBridge',),
+
+    # Services -> Bridges
+    'authService': ('authBridge',),
+    'transactionService': ('transactionBridge',),
+    'contactService': ('contactBridge',),
+    'deviceService': ('deviceBridge',),
+
+    # Bridges -> Handlers
+    'syncBridge': ('syncHandlers',),
+    'transactionBridge': ('transactionHandlers',),
+    'contactBridge': ('contactHandlers',),
+    'messageBridge': ('messageHandlers',),
+    'authBridge': ('authHandlers',),
+    'deviceBridge': ('deviceHandlers',),
+    'llmBridge': ('llmHandlers',),
+
+    # Handlers -> Backend Services
+    'syncHandlers': ('syncOrchestrator', 'deviceDetectionService'),
+    'transactionHandlers': ('gmailFetchService', 'outlookFetchService', 'databaseService'),
+    'contactHandlers': ('databaseService',),
+    'messageHandlers': ('macOSMessagesImport', 'databaseService'),
+    'authHandlers': ('gmailFetchService', 'outlookFetchService', 'supabaseService', 'tokenEncryptionService'),
+    'deviceHandlers': ('deviceDetectionService',),
+
+    # Backend -> Backend/Storage
+    'syncOrchestrator': ('deviceDetectionService', 'backupService', 'iOSMessagesParser', 'iPhoneSyncStorage'),
+    'gmailFetchService': ('gmailApi', 'databaseService'),
+    'outlookFetchService': ('graphApi', 'databaseService'),
+    'deviceDetectionService': ('libimobiledevice',),
+    'backupService': ('libimobiledevice',),
+    'iOSMessagesParser': ('sqlite',),
+    'macOSMessagesImport': ('sqlite',),
+    'iPhoneSyncStorage': ('databaseService',),
+    'databaseService': ('sqlite',),
+    'supabaseService': ('supabase',),
+}
+
+# Everything should_include sees for each layer, joined once. Focus keywords
+# never contain spaces, so a search over the joined text matches exactly when
+# at least one node in the layer would be included.
+_LAYER_TEXT = {
+    'components': ' '.join(f"{name} {file}" for name, file, _ in _KEY_COMPONENTS),
+    'hooks': ' '.join(f"{name} {file}" for name, file, _, _ in _KEY_HOOKS),
+    'services': ' '.join(f"{name} {file}" for name, file, _ in _KEY_FRONTEND_SERVICES),
+    'ipc': ' '.join(f"{name} {api}" for name, api, _ in _IPC_BRIDGES),
+    'handlers': ' '.join(f"{name} {file}" for name, file, _ in _KEY_HANDLERS),
+    'backend': ' '.join(f"{name} {file}" for name, file, _ in _KEY_BACKEND_SERVICES),
+    'storage': ' '.join(f"{name} {desc}" for _, name, _, desc in _STORAGE_NODES),
+}
 
 @dataclass
 class ArchNode:
@@ -40,299 +185,212 @@ class ArchitectureScanner:
             'backend': {'color': '#58a6ff', 'label': 'Backend', 'desc': 'Electron Services'},
             'storage': {'color': '#f85149', 'label': 'Storage', 'desc': 'Data & APIs'},
         }
+        self.nodes_by_layer: Dict[str, List[ArchNode]] = {layer: [] for layer in self.layers}
 
-        # Focus filters
+        # Focus filters (matched case-insensitively)
         self.focus_keywords = {
-            'sync': ['sync', 'Sync', 'queue', 'Queue', 'refresh', 'Refresh', 'iPhone', 'iphone', 'device', 'Device'],
-            'auth': ['auth', 'Auth', 'login', 'Login', 'oauth', 'OAuth', 'token', 'Token', 'session', 'Session'],
-            'email': ['email', 'Email', 'gmail', 'Gmail', 'outlook', 'Outlook', 'mail', 'Mail', 'graph', 'Graph'],
+            'sync': ('sync', 'queue', 'refresh', 'iphone', 'device'),
+            'auth': ('auth', 'login', 'oauth', 'token', 'session'),
+            'email': ('email', 'gmail', 'outlook', 'mail', 'graph'),
         }
 
+        # Compiled once so should_include is a single regex search per node
+        self._focus_re = None
+        if focus:
+            keywords = self.focus_keywords.get(focus, ())
+            self._focus_re = re.compile(
+                '|'.join(re.escape(kw) for kw in keywords) or r'(?!)',
+                re.IGNORECASE
+            )
+
     def should_include(self, name: str, file: str) -> bool:
         """Check if node should be included based on focus filter."""
-        if not self.focus:
+        if self._focus_re is None:
             return True
-        keywords = self.focus_keywords.get(self.focus, [])
-        text = f"{name} {file}".lower()
-        return any(kw.lower() in text for kw in keywords)
+        return self._focus_re.search(f"{name} {file}") is not None
+
+    def add_node(self, node: ArchNode):
+        """Register a node and bucket it under its layer."""
+        self.nodes[node.id] = node
+        self.nodes_by_layer[node.layer].append(node)
 
     def scan_components(self):
         """Scan React components."""
-        components_dir = BASE_DIR / "src" / "components"
-        if not components_dir.exists():
+        components_dir = os.path.join(_SRC, "components")
+        if not os.path.isdir(components_dir):
             return
 
-        # Key components to always include
-        key_components = [
-            ("Dashboard", "Dashboard.tsx", "Main dashboard view with sync status and navigation"),
-            ("SyncStatusIndicator", "dashboard/SyncStatusIndicator.tsx", "Shows sync progress for contacts, emails, messages"),
-            ("ConversationList", "ConversationList/index.tsx", "Displays email and message conversations"),
-            ("Contacts", "Contacts.tsx", "Contact management view"),
-            ("Login", "Login.tsx", "Google OAuth login screen"),
-            ("MicrosoftLogin", "MicrosoftLogin.tsx", "Microsoft OAuth login screen"),
-            ("AuditTransactionModal", "AuditTransactionModal.tsx", "Transaction audit dialog"),
-            ("OnboardingFlow", "OnboardingFlow.tsx", "Multi-step onboarding sequence"),
-        ]
-
-        for name, file, desc in key_components:
+        # Read the directory once instead of stat()ing each component
+        existing = {entry.name: entry for entry in os.scandir(components_dir)}
+
+        for name, file, desc in _KEY_COMPONENTS:
             if self.should_include(name, file):
-                full_path = components_dir / file
-                if full_path.exists() or (components_dir / file.split('/')[0]).exists():
-                    self.nodes[name] = ArchNode(
+                head, _, rest = file.partition('/')
+                entry = existing.get(head)
+                if entry is not None and (entry.is_dir() if rest else entry.is_file()):
+                    self.add_node(ArchNode(
                         id=name,
                         name=name,
                         layer='components',
                         file=f"src/components/{file}",
                         desc=desc
-                    )
+                    ))
 
     def scan_hooks(self):
         """Scan custom hooks."""
-        hooks_dir = BASE_DIR / "src" / "hooks"
-        if not hooks_dir.exists():
+        hooks_dir = os.path.join(_SRC, "hooks")
+        if not os.path.isdir(hooks_dir):
             return
 
-        key_hooks = [
-            ("useAppStateMachine", "useAppStateMachine.ts", "Central state orchestrator for app lifecycle", "src/appCore/state"),
-            ("useSyncQueue", "useSyncQueue.ts", "React hook for SyncQueueService subscription", "src/hooks"),
-            ("useAutoRefresh", "useAutoRefresh.ts", "Triggers sync operations on dashboard open", "src/hooks"),
-            ("useIPhoneSync", "useIPhoneSync.ts", "Manages iPhone device detection and sync", "src/hooks"),
-            ("useConversations", "useConversations.ts", "Loads and manages message conversations", "src/hooks"),
-            ("useMacOSMessagesImport", "useMacOSMessagesImport.ts", "macOS Messages.app import", "src/hooks"),
-            ("useAuditTransaction", "useAuditTransaction.ts", "Transaction audit workflow", "src/hooks"),
-        ]
-
-        for name, file, desc, path in key_hooks:
+        for name, file, desc, path in _KEY_HOOKS:
             if self.should_include(name, file):
-                self.nodes[name] = ArchNode(
+                self.add_node(ArchNode(
                     id=name,
                     name=name,
                     layer='hooks',
                     file=f"{path}/{file}",
                     desc=desc
-                )
+                ))
 
     def scan_frontend_services(self):
         """Scan frontend services."""
-        services_dir = BASE_DIR / "src" / "services"
-        if not services_dir.exists():
+        services_dir = os.path.join(_SRC, "services")
+        if not os.path.isdir(services_dir):
             return
 
-        key_services = [
-            ("SyncQueueService", "SyncQueueService.ts", "Singleton tracking sync state with completion detection"),
-            ("authService", "authService.ts", "Wraps authentication IPC calls"),
-            ("transactionService", "transactionService.ts", "Wraps transaction IPC calls"),
-            ("contactService", "contactService.ts", "Wraps contact IPC calls"),
-            ("deviceService", "deviceService.ts", "Device detection and iPhone sync"),
-            ("licenseService", "licenseService.ts", "License validation"),
-        ]
-
-        for name, file, desc in key_services:
+        for name, file, desc in _KEY_FRONTEND_SERVICES:
             if self.should_include(name, file):
-                self.nodes[name] = ArchNode(
+                self.add_node(ArchNode(
                     id=name,
                     name=name,
                     layer='services',
                     file=f"src/services/{file}",
                     desc=desc
-                )
+                ))
 
     def scan_ipc_bridges(self):
         """Scan IPC bridges from preload."""
-        bridges = [
-            ("syncBridge", "window.api.sync", "iPhone sync operations"),
-            ("transactionBridge", "window.api.transactions", "Scan, CRUD, export"),
-            ("contactBridge", "window.api.contacts", "Contact operations"),
-            ("messageBridge", "window.api.messages", "macOS iMessage import"),
-            ("authBridge", "window.api.auth", "OAuth login/logout"),
-            ("outlookBridge", "window.api.outlook", "Outlook email operations"),
-            ("deviceBridge", "window.api.device", "Device detection"),
-            ("llmBridge", "window.api.llm", "LLM configuration"),
-        ]
-
-        for name, api, desc in bridges:
+        for name, api, desc in _IPC_BRIDGES:
             if self.should_include(name, api):
-                self.nodes[name] = ArchNode(
+                self.add_node(ArchNode(
                     id=name,
                     name=name,
                     layer='ipc',
                     file=f"electron/preload.ts → {name}",
                     desc=f"{api}.* - {desc}"
-                )
+                ))
 
     def scan_handlers(self):
         """Scan main process handlers."""
-        handlers_dir = BASE_DIR / "electron"
-
-        key_handlers = [
-            ("syncHandlers", "sync-handlers.ts", "Handles sync:start, sync:cancel, sync:getStatus"),
-            ("transactionHandlers", "transaction-handlers.ts", "Handles transactions:scan, CRUD operations"),
-            ("contactHandlers", "contact-handlers.ts", "Handles contacts:getAll, link, sync"),
-            ("messageHandlers", "handlers/messageImportHandlers.ts", "Handles messages:importMacOSMessages"),
-            ("authHandlers", "auth-handlers.ts", "Handles OAuth login for Google/Microsoft"),
-            ("deviceHandlers", "device-handlers.ts", "Handles device detection"),
-            ("llmHandlers", "llm-handlers.ts", "Handles LLM configuration"),
-        ]
-
-        for name, file, desc in key_handlers:
+        for name, file, desc in _KEY_HANDLERS:
             if self.should_include(name, file):
-                self.nodes[name] = ArchNode(
+                self.add_node(ArchNode(
                     id=name,
                     name=name.replace('Handlers', '-handlers'),
                     layer='handlers',
                     file=f"electron/{file}",
                     desc=desc
-                )
+                ))
 
     def scan_backend_services(self):
         """Scan backend Electron services."""
-        key_services = [
-            ("syncOrchestrator", "syncOrchestrator.ts", "Orchestrates full iPhone sync pipeline"),
-            ("gmailFetchService", "gmailFetchService.ts", "Fetches emails from Gmail API with rate limiting"),
-            ("outlookFetchService", "outlookFetchService.ts", "Fetches emails from Microsoft Graph API"),
-            ("deviceDetectionService", "deviceDetectionService.ts", "Detects connected iPhones via libimobiledevice"),
-            ("backupService", "backupService.ts", "Creates encrypted iPhone backups via idevicebackup2"),
-            ("iOSMessagesParser", "iOSMessagesParser.ts", "Extracts SMS/iMessage from iPhone backup"),
-            ("macOSMessagesImport", "macOSMessagesImportService.ts", "Reads macOS Messages.app database directly"),
-            ("iPhoneSyncStorage", "iPhoneSyncStorageService.ts", "Persists sync results to local database"),
-            ("databaseService", "databaseService.ts", "SQLite facade with SQLCipher encryption"),
-            ("supabaseService", "supabaseService.ts", "Cloud sync operations"),
-            ("tokenEncryptionService", "tokenEncryptionService.ts", "OAuth token encryption via safeStorage"),
-        ]
-
-        for name, file, desc in key_services:
+        for name, file, desc in _KEY_BACKEND_SERVICES:
             if self.should_include(name, file):
-                self.nodes[name] = ArchNode(
+                self.add_node(ArchNode(
                     id=name,
                     name=name,
                     layer='backend',
                     file=f"electron/services/{file}",
                     desc=desc
-                )
+                ))
 
     def scan_storage(self):
         """Add storage and external API nodes."""
-        storage_nodes = [
-            ("sqlite", "SQLite + SQLCipher", "Local encrypted database", "Encrypted local DB. Tables: users, contacts, messages, transactions"),
-            ("supabase", "Supabase", "Cloud database", "User profiles, devices, API quotas. RLS enforced."),
-            ("gmailApi", "Gmail API", "External API", "Gmail API via OAuth 2.0. Scopes: mail.readonly"),
-            ("graphApi", "MS Graph API", "External API", "Microsoft Graph API. Scopes: Mail.Read"),
-            ("libimobiledevice", "libimobiledevice", "Native library", "iPhone communication via USB"),
-        ]
-
-        for id, name, file, desc in storage_nodes:
+        for id, name, file, desc in _STORAGE_NODES:
             if self.should_include(name, desc):
-                self.nodes[id] = ArchNode(
+                self.add_node(ArchNode(
                     id=id,
                     name=name,
                     layer='storage',
                     file=file,
                     desc=desc
-                )
+                ))
 
     def build_connections(self):
         """Build connection graph based on known relationships."""
-        # Define connections (source -> targets)
-        connections = {
-            # Components -> Hooks
-            'Dashboard': ['useSyncQueue', 'useAutoRefresh', 'SyncStatusIndicator'],
-            'SyncStatusIndicator': ['useSyncQueue'],
-            'ConversationList': ['useConversations'],
-            'Contacts': ['contactService', 'contactBridge'],
-            'Login': ['authService'],
-            'MicrosoftLogin': ['authService'],
-
-            # Hooks -> Services/Bridges
-            'useAppStateMachine': ['useAutoRefresh', 'authService'],
-            'useSyncQueue': ['SyncQueueService'],
-            'useAutoRefresh': ['SyncQueueService', 'transactionBridge', 'messageBridge', 'contactBridge'],
-            'useIPhoneSync': ['syncBridge'],
-            'useConversations': ['messageBridge'],
-            'useMacOSMessagesImport': ['messageBridge'],
-
-            # Services -> Bridges
-            'authService': ['authBridge'],
-            'transactionService': ['transactionBridge'],
-            'contactService': ['contactBridge'],
-            'deviceService': ['deviceBridge'],
-
-            # Bridges -> Handlers
-            'syncBridge': ['syncHandlers'],
-            'transactionBridge': ['transactionHandlers'],
-            'contactBridge': ['contactHandlers'],
-            'messageBridge': ['messageHandlers'],
-            'authBridge': ['authHandlers'],
-            'deviceBridge': ['deviceHandlers'],
-            'llmBridge': ['llmHandlers'],
-
-            # Handlers -> Backend Services
-            'syncHandlers': ['syncOrchestrator', 'deviceDetectionService'],
-            'transactionHandlers': ['gmailFetchService', 'outlookFetchService', 'databaseService'],
-            'contactHandlers': ['databaseService'],
-            'messageHandlers': ['macOSMessagesImport', 'databaseService'],
-            'authHandlers': ['gmailFetchService', 'outlookFetchService', 'supabaseService', 'tokenEncryptionService'],
-            'deviceHandlers': ['deviceDetectionService'],
-
-            # Backend -> Backend/Storage
-            'syncOrchestrator': ['deviceDetectionService', 'backupService', 'iOSMessagesParser', 'iPhoneSyncStorage'],
-            'gmailFetchService': ['gmailApi', 'databaseService'],
-            'outlookFetchService': ['graphApi', 'databaseService'],
-            'deviceDetectionService': ['libimobiledevice'],
-            'backupService': ['libimobiledevice'],
-            'iOSMessagesParser': ['sqlite'],
-            'macOSMessagesImport': ['sqlite'],
-            'iPhoneSyncStorage': ['databaseService'],
-            'databaseService': ['sqlite'],
-            'supabaseService': ['supabase'],
-        }
-
-        for source, targets in connections.items():
-            if source in self.nodes:
-                self.nodes[source].connects = [t for t in targets if t in self.nodes]
+        present = self.nodes.keys()
+        for source in _CONNECTIONS.keys() & present:
+            self.nodes[source].connects = [t for t in _CONNECTIONS[source] if t in present]
 
     def scan_all(self):
-        """Run all scans."""
-        self.scan_components()
-        self.scan_hooks()
-        self.scan_frontend_services()
-        self.scan_ipc_bridges()
-        self.scan_handlers()
-        self.scan_backend_services()
-        self.scan_storage()
+        """Run all scans, skipping layers the focus filter cannot match."""
+        scans = (
+            ('components', self.scan_components),
+            ('hooks', self.scan_hooks),
+            ('services', self.scan_frontend_services),
+            ('ipc', self.scan_ipc_bridges),
+            ('handlers', self.scan_handlers),
+            ('backend', self.scan_backend_services),
+            ('storage', self.scan_storage),
+        )
+        for layer, scan in scans:
+            if self._focus_re is None or self._focus_re.search(_LAYER_TEXT[layer]):
+                scan()
         self.build_connections()
 
-    def to_json(self) -> str:
-        """Convert nodes to JSON for the HTML template."""
-        data = {}
+    def to_json(self, pretty: bool = False) -> str:
+        """Convert nodes to JSON for the HTML template (compact unless pretty)."""
+        if pretty:
+            data = {}
+            for id, node in self.nodes.items():
+                data[id] = {
+                    'layer': node.layer,
+                    'file': node.file,
+                    'desc': node.desc,
+                    'connects': node.connects
+                }
+            return json.dumps(data, indent=2, ensure_ascii=False)
+
+        # Ids and layers are plain identifiers; only the free-text fields need escaping
+        parts = []
         for id, node in self.nodes.items():
-            data[id] = {
-                'layer': node.layer,
-                'file': node.file,
-                'desc': node.desc,
-                'connects': node.connects
-            }
-        return json.dumps(data, indent=2)
-
-    def generate_html(self) -> str:
+            connects = ','.join(f'"{t}"' for t in node.connects)
+            parts.append(
+                f'"{id}":{{"layer":"{node.layer}",'
+                f'"file":{json.dumps(node.file, ensure_ascii=False)},'
+                f'"desc":{json.dumps(node.desc, ensure_ascii=False)},'
+                f'"connects":[{connects}]}}'
+            )
+        return '{' + ','.join(parts) + '}'
+
+    def state_hash(self, pretty: bool = False) -> str:
+        """Hash everything generate_html depends on, including this script."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(self.to_json(pretty=pretty).encode('utf-8'))
+        digest.update(f"{self.focus or ''}|{os.stat(__file__).st_mtime_ns}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def generate_html(self, pretty: bool = False) -> str:
         """Generate the full HTML diagram."""
-        nodes_json = self.to_json()
+        nodes_json = self.to_json(pretty=pretty)
 
         # Group nodes by layer
-        layers_html = ""
+        layer_parts = []
         for layer_id, layer_info in self.layers.items():
-            layer_nodes = [n for n in self.nodes.values() if n.layer == layer_id]
+            layer_nodes = self.nodes_by_layer[layer_id]
             if not layer_nodes:
                 continue
 
-            nodes_html = ""
+            node_parts = []
             for node in layer_nodes:
-                nodes_html += f'''
+                node_parts.append(f'''
           <div class="node" data-id="{node.id}" onclick="selectNode('{node.id}')">
             <div class="node-name">{node.name}</div>
             <div class="node-type">{node.file.split('/')[-1]}</div>
-          </div>'''
+          </div>''')
+            nodes_html = ''.join(node_parts)
 
-            layers_html += f'''
+            layer_parts.append(f'''
       <div class="layer {layer_id}">
         <div class="layer-label">
           <div class="label-name">{layer_info['label']}</div>
@@ -341,7 +399,8 @@ class ArchitectureScanner:
         <div class="layer-content">{nodes_html}
         </div>
       </div>
-'''
+''')
+        layers_html = ''.join(layer_parts)
 
         focus_title = f" ({self.focus.upper()} focus)" if self.focus else ""
 
@@ -351,8 +410,53 @@ class ArchitectureScanner:
   <meta charset="UTF-8">
   <meta name="viewport" content="width=device-width, initial-scale=1.0">
   <title>Magic Audit - Architecture Debugger{focus_title}</title>
-  <style>
-    :root {{
+{_CSS}
+</head>
+<body>
+  <aside class="sidebar">
+    <h1>Architecture Debugger</h1>
+    <p class="subtitle">Click any component to trace its connections{focus_title}</p>
+    <button class="reset-btn" onclick="resetSelection()">Reset View</button>
+    <div class="chain-info" id="chainInfo">
+      <div class="no-selection">Click on any component to see its full connection chain.</div>
+    </div>
+    <div class="legend">
+      <h4>Layers</h4>
+      <div class="legend-item"><div class="legend-dot" style="background: var(--green);"></div><span>React Components</span></div>
+      <div class="legend-item"><div class="legend-dot" style="background: var(--cyan);"></div><span>Custom Hooks</span></div>
+      <div class="legend-item"><div class="legend-dot" style="background: var(--purple);"></div><span>Frontend Services</span></div>
+      <div class="legend-item"><div class="legend-dot" style="background: var(--orange);"></div><span>IPC Bridges</span></div>
+      <div class="legend-item"><div class="legend-dot" style="background: var(--pink);"></div><span>Main Process Handlers</span></div>
+      <div class="legend-item"><div class="legend-dot" style="background: var(--blue);"></div><span>Backend Services</span></div>
+      <div class="legend-item"><div class="legend-dot" style="background: var(--red);"></div><span>Storage / External APIs</span></div>
+    </div>
+    <div class="generated-info">Auto-generated by /architecture skill</div>
+  </aside>
+
+  <main class="main">
+    <div class="instructions">
+      <span class="instructions-icon">🔍</span>
+      <div class="instructions-text">
+        <strong>Debug Mode:</strong> Click any node to trace the data flow from UI to database/API.
+      </div>
+    </div>
+    <div class="layers" id="layers">
+{layers_html}
+    </div>
+  </main>
+
+  <script>
+    const architecture = {nodes_json};
+{_SCRIPT}
+  </script>
+</body>
+</html>
+'''
+
+# Static page scaffolding, kept out of generate_html so the f-string there
+# only has to substitute the per-run values.
+_CSS = """  <style>
+    :root {
       --bg-dark: #0d1117;
       --bg-card: #161b22;
       --bg-hover: #21262d;
@@ -368,54 +472,54 @@ class ArchitectureScanner:
       --red: #f85149;
       --cyan: #39c5cf;
       --pink: #db61a2;
-    }}
-    * {{ box-sizing: border-box; margin: 0; padding: 0; }}
-    body {{
+    }
+    * { box-sizing: border-box; margin: 0; padding: 0; }
+    body {
       font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
       background: var(--bg-dark);
       color: var(--text-primary);
       min-height: 100vh;
       display: flex;
-    }}
-    .sidebar {{
+    }
+    .sidebar {
       width: 320px;
       background: var(--bg-card);
       border-right: 1px solid var(--border);
       padding: 20px;
       overflow-y: auto;
       flex-shrink: 0;
-    }}
-    .sidebar h1 {{ font-size: 1.1rem; margin-bottom: 5px; color: var(--blue); }}
-    .sidebar .subtitle {{ font-size: 0.75rem; color: var(--text-secondary); margin-bottom: 20px; }}
-    .chain-info {{ margin-top: 20px; }}
-    .chain-info h3 {{ font-size: 0.8rem; text-transform: uppercase; letter-spacing: 1px; color: var(--text-secondary); margin-bottom: 10px; }}
-    .chain-step {{
+    }
+    .sidebar h1 { font-size: 1.1rem; margin-bottom: 5px; color: var(--blue); }
+    .sidebar .subtitle { font-size: 0.75rem; color: var(--text-secondary); margin-bottom: 20px; }
+    .chain-info { margin-top: 20px; }
+    .chain-info h3 { font-size: 0.8rem; text-transform: uppercase; letter-spacing: 1px; color: var(--text-secondary); margin-bottom: 10px; }
+    .chain-step {
       background: var(--bg-hover);
       border: 1px solid var(--border);
       border-radius: 6px;
       padding: 10px;
       margin-bottom: 8px;
       font-size: 0.8rem;
-    }}
-    .chain-step.active {{ border-color: var(--blue); background: rgba(88, 166, 255, 0.1); }}
-    .chain-step .step-layer {{ font-size: 0.65rem; text-transform: uppercase; color: var(--text-muted); margin-bottom: 4px; }}
-    .chain-step .step-name {{ font-weight: 600; color: var(--text-primary); }}
-    .chain-step .step-file {{ font-size: 0.7rem; color: var(--cyan); font-family: 'SF Mono', Monaco, monospace; margin-top: 4px; word-break: break-all; }}
-    .chain-step .step-desc {{ font-size: 0.7rem; color: var(--text-secondary); margin-top: 4px; }}
-    .chain-arrow {{ text-align: center; color: var(--text-muted); font-size: 0.8rem; margin: 4px 0; }}
-    .no-selection {{ color: var(--text-secondary); font-size: 0.85rem; text-align: center; padding: 40px 20px; }}
-    .legend {{ margin-top: 30px; padding-top: 20px; border-top: 1px solid var(--border); }}
-    .legend h4 {{ font-size: 0.7rem; text-transform: uppercase; color: var(--text-muted); margin-bottom: 10px; }}
-    .legend-item {{ display: flex; align-items: center; gap: 8px; font-size: 0.75rem; color: var(--text-secondary); margin-bottom: 6px; }}
-    .legend-dot {{ width: 12px; height: 12px; border-radius: 3px; }}
-    .main {{ flex: 1; padding: 30px; overflow: auto; }}
-    .layers {{ display: flex; flex-direction: column; gap: 20px; max-width: 1400px; margin: 0 auto; }}
-    .layer {{ display: flex; align-items: flex-start; gap: 20px; }}
-    .layer-label {{ width: 120px; flex-shrink: 0; text-align: right; padding-top: 12px; }}
-    .layer-label .label-name {{ font-size: 0.75rem; font-weight: 600; text-transform: uppercase; letter-spacing: 1px; }}
-    .layer-label .label-desc {{ font-size: 0.65rem; color: var(--text-muted); margin-top: 2px; }}
-    .layer-content {{ flex: 1; display: flex; flex-wrap: wrap; gap: 10px; }}
-    .node {{
+    }
+    .chain-step.active { border-color: var(--blue); background: rgba(88, 166, 255, 0.1); }
+    .chain-step .step-layer { font-size: 0.65rem; text-transform: uppercase; color: var(--text-muted); margin-bottom: 4px; }
+    .chain-step .step-name { font-weight: 600; color: var(--text-primary); }
+    .chain-step .step-file { font-size: 0.7rem; color: var(--cyan); font-family: 'SF Mono', Monaco, monospace; margin-top: 4px; word-break: break-all; }
+    .chain-step .step-desc { font-size: 0.7rem; color: var(--text-secondary); margin-top: 4px; }
+    .chain-arrow { text-align: center; color: var(--text-muted); font-size: 0.8rem; margin: 4px 0; }
+    .no-selection { color: var(--text-secondary); font-size: 0.85rem; text-align: center; padding: 40px 20px; }
+    .legend { margin-top: 30px; padding-top: 20px; border-top: 1px solid var(--border); }
+    .legend h4 { font-size: 0.7rem; text-transform: uppercase; color: var(--text-muted); margin-bottom: 10px; }
+    .legend-item { display: flex; align-items: center; gap: 8px; font-size: 0.75rem; color: var(--text-secondary); margin-bottom: 6px; }
+    .legend-dot { width: 12px; height: 12px; border-radius: 3px; }
+    .main { flex: 1; padding: 30px; overflow: auto; }
+    .layers { display: flex; flex-direction: column; gap: 20px; max-width: 1400px; margin: 0 auto; }
+    .layer { display: flex; align-items: flex-start; gap: 20px; }
+    .layer-label { width: 120px; flex-shrink: 0; text-align: right; padding-top: 12px; }
+    .layer-label .label-name { font-size: 0.75rem; font-weight: 600; text-transform: uppercase; letter-spacing: 1px; }
+    .layer-label .label-desc { font-size: 0.65rem; color: var(--text-muted); margin-top: 2px; }
+    .layer-content { flex: 1; display: flex; flex-wrap: wrap; gap: 10px; }
+    .node {
       background: var(--bg-card);
       border: 2px solid var(--border);
       border-radius: 8px;
@@ -423,28 +527,28 @@ class ArchitectureScanner:
       cursor: pointer;
       transition: all 0.2s ease;
       min-width: 140px;
-    }}
-    .node:hover {{ border-color: var(--text-secondary); transform: translateY(-2px); }}
-    .node.highlighted {{ border-color: var(--blue); background: rgba(88, 166, 255, 0.15); box-shadow: 0 0 20px rgba(88, 166, 255, 0.3); z-index: 10; }}
-    .node.dimmed {{ opacity: 0.3; }}
-    .node.selected {{ border-color: var(--green); background: rgba(63, 185, 80, 0.15); box-shadow: 0 0 20px rgba(63, 185, 80, 0.3); }}
-    .node .node-name {{ font-weight: 600; font-size: 0.85rem; margin-bottom: 4px; }}
-    .node .node-type {{ font-size: 0.65rem; color: var(--text-muted); font-family: 'SF Mono', Monaco, monospace; }}
-    .layer.components .layer-label .label-name {{ color: var(--green); }}
-    .layer.components .node {{ border-left: 3px solid var(--green); }}
-    .layer.hooks .layer-label .label-name {{ color: var(--cyan); }}
-    .layer.hooks .node {{ border-left: 3px solid var(--cyan); }}
-    .layer.services .layer-label .label-name {{ color: var(--purple); }}
-    .layer.services .node {{ border-left: 3px solid var(--purple); }}
-    .layer.ipc .layer-label .label-name {{ color: var(--orange); }}
-    .layer.ipc .node {{ border-left: 3px solid var(--orange); }}
-    .layer.handlers .layer-label .label-name {{ color: var(--pink); }}
-    .layer.handlers .node {{ border-left: 3px solid var(--pink); }}
-    .layer.backend .layer-label .label-name {{ color: var(--blue); }}
-    .layer.backend .node {{ border-left: 3px solid var(--blue); }}
-    .layer.storage .layer-label .label-name {{ color: var(--red); }}
-    .layer.storage .node {{ border-left: 3px solid var(--red); }}
-    .reset-btn {{
+    }
+    .node:hover { border-color: var(--text-secondary); transform: translateY(-2px); }
+    .node.highlighted { border-color: var(--blue); background: rgba(88, 166, 255, 0.15); box-shadow: 0 0 20px rgba(88, 166, 255, 0.3); z-index: 10; }
+    .node.dimmed { opacity: 0.3; }
+    .node.selected { border-color: var(--green); background: rgba(63, 185, 80, 0.15); box-shadow: 0 0 20px rgba(63, 185, 80, 0.3); }
+    .node .node-name { font-weight: 600; font-size: 0.85rem; margin-bottom: 4px; }
+    .node .node-type { font-size: 0.65rem; color: var(--text-muted); font-family: 'SF Mono', Monaco, monospace; }
+    .layer.components .layer-label .label-name { color: var(--green); }
+    .layer.components .node { border-left: 3px solid var(--green); }
+    .layer.hooks .layer-label .label-name { color: var(--cyan); }
+    .layer.hooks .node { border-left: 3px solid var(--cyan); }
+    .layer.services .layer-label .label-name { color: var(--purple); }
+    .layer.services .node { border-left: 3px solid var(--purple); }
+    .layer.ipc .layer-label .label-name { color: var(--orange); }
+    .layer.ipc .node { border-left: 3px solid var(--orange); }
+    .layer.handlers .layer-label .label-name { color: var(--pink); }
+    .layer.handlers .node { border-left: 3px solid var(--pink); }
+    .layer.backend .layer-label .label-name { color: var(--blue); }
+    .layer.backend .node { border-left: 3px solid var(--blue); }
+    .layer.storage .layer-label .label-name { color: var(--red); }
+    .layer.storage .node { border-left: 3px solid var(--red); }
+    .reset-btn {
       background: var(--bg-hover);
       border: 1px solid var(--border);
       color: var(--text-secondary);
@@ -453,9 +557,9 @@ class ArchitectureScanner:
       font-size: 0.8rem;
       cursor: pointer;
       transition: all 0.2s;
-    }}
-    .reset-btn:hover {{ border-color: var(--text-secondary); color: var(--text-primary); }}
-    .instructions {{
+    }
+    .reset-btn:hover { border-color: var(--text-secondary); color: var(--text-primary); }
+    .instructions {
       background: var(--bg-hover);
       border: 1px solid var(--border);
       border-radius: 8px;
@@ -464,161 +568,174 @@ class ArchitectureScanner:
       display: flex;
       align-items: center;
       gap: 15px;
-    }}
-    .instructions-icon {{ font-size: 1.5rem; }}
-    .instructions-text {{ font-size: 0.85rem; color: var(--text-secondary); }}
-    .instructions-text strong {{ color: var(--text-primary); }}
-    .generated-info {{ font-size: 0.7rem; color: var(--text-muted); margin-top: 15px; text-align: center; }}
-  </style>
-</head>
-<body>
-  <aside class="sidebar">
-    <h1>Architecture Debugger</h1>
-    <p class="subtitle">Click any component to trace its connections{focus_title}</p>
-    <button class="reset-btn" onclick="resetSelection()">Reset View</button>
-    <div class="chain-info" id="chainInfo">
-      <div class="no-selection">Click on any component to see its full connection chain.</div>
-    </div>
-    <div class="legend">
-      <h4>Layers</h4>
-      <div class="legend-item"><div class="legend-dot" style="background: var(--green);"></div><span>React Components</span></div>
-      <div class="legend-item"><div class="legend-dot" style="background: var(--cyan);"></div><span>Custom Hooks</span></div>
-      <div class="legend-item"><div class="legend-dot" style="background: var(--purple);"></div><span>Frontend Services</span></div>
-      <div class="legend-item"><div class="legend-dot" style="background: var(--orange);"></div><span>IPC Bridges</span></div>
-      <div class="legend-item"><div class="legend-dot" style="background: var(--pink);"></div><span>Main Process Handlers</span></div>
-      <div class="legend-item"><div class="legend-dot" style="background: var(--blue);"></div><span>Backend Services</span></div>
-      <div class="legend-item"><div class="legend-dot" style="background: var(--red);"></div><span>Storage / External APIs</span></div>
-    </div>
-    <div class="generated-info">Auto-generated by /architecture skill</div>
-  </aside>
-
-  <main class="main">
-    <div class="instructions">
-      <span class="instructions-icon">🔍</span>
-      <div class="instructions-text">
-        <strong>Debug Mode:</strong> Click any node to trace the data flow from UI to database/API.
-      </div>
-    </div>
-    <div class="layers" id="layers">
-{layers_html}
-    </div>
-  </main>
-
-  <script>
-    const architecture = {nodes_json};
+    }
+    .instructions-icon { font-size: 1.5rem; }
+    .instructions-text { font-size: 0.85rem; color: var(--text-secondary); }
+    .instructions-text strong { color: var(--text-primary); }
+    .generated-info { font-size: 0.7rem; color: var(--text-muted); margin-top: 15px; text-align: center; }
+  </style>"""
+
+_SCRIPT = """
+    // Reverse adjacency (target -> sources), built once for upstream lookups
+    const reverseAdj = {};
+    for (const [id, node] of Object.entries(architecture)) {
+      for (const connId of node.connects || []) {
+        (reverseAdj[connId] ||= []).push(id);
+      }
+    }
+
+    // architecture never changes after load, so each node's chain is computed once
+    const chainCache = new Map();
+
+    // Node elements are static, so look them up once and track the class each one has
+    const nodeById = new Map([...document.querySelectorAll('.node')].map(el => [el.dataset.id, el]));
+    const nodeClass = new Map();
 
     let selectedNode = null;
     let highlightedNodes = new Set();
+    let prevHighlighted = new Set();
+    let prevHadSelection = false;
 
-    function selectNode(nodeId) {{
+    function selectNode(nodeId) {
       selectedNode = nodeId;
-      highlightedNodes.clear();
-      const chain = buildChain(nodeId);
+      const chain = getChain(nodeId);
       highlightedNodes = new Set(chain.map(step => step.id));
       updateNodeStyles();
       updateChainInfo(chain);
-    }}
+    }
 
-    function buildChain(startId) {{
+    function buildChain(startId) {
       const chain = [];
       const visited = new Set();
       const layerOrder = ['components', 'hooks', 'services', 'ipc', 'handlers', 'backend', 'storage'];
 
-      function traverseForward(id, depth = 0) {{
+      function traverseForward(id, depth = 0) {
         if (visited.has(id) || !architecture[id]) return;
         visited.add(id);
         const node = architecture[id];
-        chain.push({{ id, ...node, direction: depth === 0 ? 'origin' : 'downstream' }});
-        for (const connId of node.connects || []) {{
+        chain.push({ id, ...node, direction: depth === 0 ? 'origin' : 'downstream' });
+        for (const connId of node.connects || []) {
           traverseForward(connId, depth + 1);
-        }}
-      }}
-
-      function findUpstream(targetId) {{
-        const upstream = [];
-        for (const [id, node] of Object.entries(architecture)) {{
-          if (node.connects && node.connects.includes(targetId)) {{
-            upstream.push(id);
-          }}
-        }}
-        return upstream;
-      }}
-
-      function traverseBackward(id) {{
+        }
+      }
+
+      function findUpstream(targetId) {
+        return reverseAdj[targetId] || [];
+      }
+
+      function traverseBackward(id) {
         const upstreamIds = findUpstream(id);
-        for (const upId of upstreamIds) {{
-          if (!visited.has(upId) && architecture[upId]) {{
+        for (const upId of upstreamIds) {
+          if (!visited.has(upId) && architecture[upId]) {
             visited.add(upId);
             const node = architecture[upId];
-            chain.unshift({{ id: upId, ...node, direction: 'upstream' }});
+            chain.unshift({ id: upId, ...node, direction: 'upstream' });
             traverseBackward(upId);
-          }}
-        }}
-      }}
+          }
+        }
+      }
 
       traverseForward(startId);
       traverseBackward(startId);
       chain.sort((a, b) => layerOrder.indexOf(a.layer) - layerOrder.indexOf(b.layer));
       return chain;
-    }}
-
-    function updateNodeStyles() {{
-      document.querySelectorAll('.node').forEach(node => {{
-        const nodeId = node.dataset.id;
-        node.classList.remove('highlighted', 'selected', 'dimmed');
-        if (selectedNode) {{
-          if (nodeId === selectedNode) {{
-            node.classList.add('selected');
-          }} else if (highlightedNodes.has(nodeId)) {{
-            node.classList.add('highlighted');
-          }} else {{
-            node.classList.add('dimmed');
-          }}
-        }}
-      }});
-    }}
-
-    function updateChainInfo(chain) {{
+    }
+
+    function getChain(nodeId) {
+      let chain = chainCache.get(nodeId);
+      if (!chain) {
+        chain = buildChain(nodeId);
+        chainCache.set(nodeId, chain);
+      }
+      return chain;
+    }
+
+    // Warm the cache while the page is idle so clicks never traverse
+    if ('requestIdleCallback' in window) {
+      requestIdleCallback(() => {
+        for (const id of Object.keys(architecture)) getChain(id);
+      });
+    }
+
+    function updateNodeStyles() {
+      const hasSelection = Boolean(selectedNode);
+      // Toggling selection on/off flips dimming everywhere; otherwise only nodes
+      // entering or leaving the chain can change class.
+      const candidates = hasSelection !== prevHadSelection
+        ? nodeById.keys()
+        : new Set([...prevHighlighted, ...highlightedNodes]);
+      for (const nodeId of candidates) {
+        const node = nodeById.get(nodeId);
+        if (!node) continue;
+        let cls = null;
+        if (hasSelection) {
+          if (nodeId === selectedNode) {
+            cls = 'selected';
+          } else if (highlightedNodes.has(nodeId)) {
+            cls = 'highlighted';
+          } else {
+            cls = 'dimmed';
+          }
+        }
+        const prev = nodeClass.get(nodeId) || null;
+        if (cls === prev) continue;
+        if (prev) node.classList.remove(prev);
+        if (cls) node.classList.add(cls);
+        nodeClass.set(nodeId, cls);
+      }
+      prevHighlighted = highlightedNodes;
+      prevHadSelection = hasSelection;
+    }
+
+    function textDiv(className, text) {
+      const div = document.createElement('div');
+      div.className = className;
+      div.textContent = text;
+      return div;
+    }
+
+    function updateChainInfo(chain) {
       const container = document.getElementById('chainInfo');
-      if (chain.length === 0) {{
+      if (chain.length === 0) {
         container.innerHTML = '<div class="no-selection">Click on any component to see its full connection chain.</div>';
         return;
-      }}
-      let html = '<h3>Connection Chain</h3>';
-      chain.forEach((step, index) => {{
-        const isOrigin = step.direction === 'origin';
-        html += `
-          <div class="chain-step ${{isOrigin ? 'active' : ''}}">
-            <div class="step-layer">${{step.layer}}</div>
-            <div class="step-name">${{step.id}}</div>
-            <div class="step-file">${{step.file}}</div>
-            <div class="step-desc">${{step.desc}}</div>
-          </div>
-        `;
-        if (index < chain.length - 1) {{
-          html += '<div class="chain-arrow">↓</div>';
-        }}
-      }});
-      container.innerHTML = html;
-    }}
-
-    function resetSelection() {{
+      }
+      // Build real DOM nodes: no HTML re-parse per click, and field text is never interpreted as markup
+      const header = document.createElement('h3');
+      header.textContent = 'Connection Chain';
+      const frag = document.createDocumentFragment();
+      chain.forEach((step, index) => {
+        const stepDiv = document.createElement('div');
+        stepDiv.className = step.direction === 'origin' ? 'chain-step active' : 'chain-step';
+        stepDiv.append(
+          textDiv('step-layer', step.layer),
+          textDiv('step-name', step.id),
+          textDiv('step-file', step.file),
+          textDiv('step-desc', step.desc)
+        );
+        frag.appendChild(stepDiv);
+        if (index < chain.length - 1) {
+          frag.appendChild(textDiv('chain-arrow', '↓'));
+        }
+      });
+      container.replaceChildren(header, frag);
+    }
+
+    function resetSelection() {
       selectedNode = null;
-      highlightedNodes.clear();
+      highlightedNodes = new Set();
       updateNodeStyles();
       document.getElementById('chainInfo').innerHTML =
         '<div class="no-selection">Click on any component to see its full connection chain.</div>';
-    }}
-  </script>
-</body>
-</html>
-'''
+    }"""
 
 def main():
     parser = argparse.ArgumentParser(description='Generate architecture diagram')
     parser.add_argument('--focus', choices=['sync', 'auth', 'email'],
                         help='Focus on specific area')
     parser.add_argument('focus_arg', nargs='?', help='Focus area (alternative)')
+    parser.add_argument('--pretty', action='store_true',
+                        help='Indent the embedded node JSON for debugging')
     args = parser.parse_args()
 
     focus = args.focus or args.focus_arg
@@ -626,11 +743,27 @@ def main():
     scanner = ArchitectureScanner(focus=focus)
     scanner.scan_all()
 
-    html = scanner.generate_html()
-
     output_path = BASE_DIR / "architecture-debug.html"
-    with open(output_path, 'w') as f:
-        f.write(html)
+
+    # Reuse the last render for this variant when nothing it depends on changed.
+    # Only known focus values are cached: the positional focus is free text and
+    # must not end up in a file name.
+    if focus and focus not in scanner.focus_keywords:
+        output_path.write_bytes(scanner.generate_html(pretty=args.pretty).encode('utf-8'))
+    else:
+        variant = (focus or 'all') + ('-pretty' if args.pretty else '')
+        state = scanner.state_hash(pretty=args.pretty)
+        cache_path = CACHE_DIR / f"{variant}-{state}.html"
+        if cache_path.exists():
+            shutil.copyfile(cache_path, output_path)
+        else:
+            html = scanner.generate_html(pretty=args.pretty)
+            CACHE_DIR.mkdir(exist_ok=True)
+            # Match the hash length exactly so "all-*" doesn't also evict "all-pretty-*"
+            for stale in CACHE_DIR.glob(f"{variant}-" + "?" * len(state) + ".html"):
+                stale.unlink()
+            cache_path.write_bytes(html.encode('utf-8'))
+            shutil.copyfile(cache_path, output_path)
 
     print(f"✓ Generated architecture diagram: {output_path}")
     print(f"  Nodes: {len(scanner.nodes)}")
@@ -0,0 +1,81 @@
+"""
+Reading helpers for tokens.csv, shared by the log-metrics scripts.
+
+tokens.csv is appended to by log_metrics.py and, as raw lines, by the
+SubagentStop hook, so side files (sum_effort's task index, log_metrics'
+summary cache) record how far into the file they have read. These helpers
+parse rows while tracking byte offsets, treat a partly written last row as
+not there yet, and fingerprint a prefix of the file to notice rewrites.
+
+The side files are only accelerators: if one can't be written (read-only
+checkout, permissions) the scripts answer from the CSV without persisting it.
+"""
+
+import csv
+import io
+import re
+
+# Bytes just before a recorded offset, used to detect a rewritten CSV
+FINGERPRINT_BYTES = 64
+
+# A CR not followed by LF, which text mode also reads as a line break
+BARE_CR_RE = re.compile(rb"\r(?!\n)")
+
+
+def column_positions(header):
+    """Map column name -> position; on duplicate names the last wins, as in csv.DictReader."""
+    return {name: position for position, name in enumerate(header)}
+
+
+def iter_rows_with_offsets(f, start):
+    """Yield (start, end, fields) for each complete CSV row of binary file f.
+
+    Parsing begins at byte offset start. A trailing line without a newline is
+    left alone, since a writer may still be appending it.
+    """
+    f.seek(start)
+    pos = start
+    row_start = None
+    exhausted = False
+
+    def lines():
+        nonlocal pos, row_start, exhausted
+        for raw in iter(f.readline, b""):
+            if not raw.endswith(b"\n"):
+                break
+            if row_start is None:
+                row_start = pos
+            pos += len(raw)
+            yield raw.decode("utf-8")
+        exhausted = True
+
+    try:
+        for fields in csv.reader(lines()):
+            if exhausted:
+                # csv.reader flushes a record cut off inside quotes at EOF
+                return
+            yield row_start, pos, fields
+            row_start = None
+    except csv.Error:
+        # Unterminated quoted field at EOF: stop at the last complete row
+        return
+
+
+def read_tail_rows(f, start):
+    """Parse the rows of binary file f from start to EOF, unterminated last line included.
+
+    Gives the same rows a text-mode csv.reader would, or [] if the data ends
+    inside a quoted field.
+    """
+    f.seek(start)
+    try:
+        return [fields for fields in csv.reader(io.StringIO(f.read().decode("utf-8"), newline=None)) if fields]
+    except csv.Error:
+        return []
+
+
+def fingerprint(f, end):
+    """Bytes of f just before end."""
+    start = max(0, end - FINGERPRINT_BYTES)
+    f.seek(start)
+    return f.read(end - start)
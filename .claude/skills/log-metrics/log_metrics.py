@@ -4,18 +4,38 @@ Log agent metrics to tokens.csv
 
 Usage:
     python log_metrics.py --agent-type engineer --task-id TASK-1184 --description "Implemented feature" --input 5000 --output 3000
+    python log_metrics.py --agent-type engineer --task-id TASK-1184 --buffer
+    python log_metrics.py --flush
 
-All arguments except --agent-type are optional.
+All arguments except --agent-type are optional. With --buffer (or
+MAD_METRICS_BUFFER=1) rows are staged in tokens.pending.jsonl and only reach
+tokens.csv on --flush.
 """
 
 import argparse
+import atexit
 import csv
+import json
 import os
+import sys
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
 
+from csv_offsets import column_positions, fingerprint, iter_rows_with_offsets, read_tail_rows
+
+try:
+    import fcntl
+except ImportError:  # Windows: staging is not locked
+    fcntl = None
+
 METRICS_DIR = Path(__file__).parent.parent.parent / "metrics"
 CSV_PATH = METRICS_DIR / "tokens.csv"
+PENDING_PATH = METRICS_DIR / "tokens.pending.jsonl"
+PENDING_LOCK_PATH = METRICS_DIR / "tokens.pending.lock"
+REJECTED_PATH = METRICS_DIR / "tokens.pending.rejected.jsonl"
+INDEX_PATH = METRICS_DIR / "tokens.taskidx"
+SUMMARY_CACHE_PATH = METRICS_DIR / "tokens.summary.json"
 
 COLUMNS = [
     "timestamp",
@@ -36,18 +56,131 @@ COLUMNS = [
     "ended_at"
 ]
 
-VALID_AGENT_TYPES = ["engineer", "pm", "sr-engineer", "qa", "explore", "fix", "main"]
+# A tuple, not a set: argparse lists choices in iteration order in --help and errors
+VALID_AGENT_TYPES = ("engineer", "pm", "sr-engineer", "qa", "explore", "fix", "main")
 
 
 def ensure_csv_exists():
     """Create CSV with headers if it doesn't exist."""
     if not CSV_PATH.exists():
         CSV_PATH.parent.mkdir(parents=True, exist_ok=True)
-        with open(CSV_PATH, "w", newline="") as f:
+        with open(CSV_PATH, "w", newline="", buffering=1 << 16) as f:
             writer = csv.writer(f)
             writer.writerow(COLUMNS)
 
 
+def _escape(value) -> str:
+    """Quote a field the way csv.writer does, skipping the work for plain values."""
+    if not isinstance(value, str):
+        # csv.writer writes None as an empty field
+        return "" if value is None else str(value)
+    if "," in value or '"' in value or "\n" in value or "\r" in value:
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def format_row(row: dict) -> str:
+    """Render a row as one tokens.csv line, byte-identical to csv.DictWriter."""
+    return ",".join([_escape(row[column]) for column in COLUMNS]) + "\r\n"
+
+
+@contextmanager
+def pending_lock():
+    """Hold an exclusive lock shared by every reader and writer of the staging file."""
+    METRICS_DIR.mkdir(parents=True, exist_ok=True)
+    with open(PENDING_LOCK_PATH, "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+class MetricsBuffer:
+    """Stage metric rows in a JSONL file and move them into tokens.csv in one batch.
+
+    Rows are held in memory and written to the staging file in one append when
+    the process exits, so many appends cost one open and one write instead of
+    an open/write/close each. That write and flush() both run under
+    pending_lock(), so a flush never misses rows from a process still running.
+    """
+
+    def __init__(self, path: Path = PENDING_PATH):
+        self.path = path
+        self._rows = None
+
+    def append(self, row: dict):
+        """Stage one row."""
+        if self._rows is None:
+            self._rows = []
+            atexit.register(self.close)
+        self._rows.append(json.dumps(row) + "\n")
+
+    def close(self):
+        """Write the rows staged by this process to the staging file."""
+        if not self._rows:
+            return
+        data = "".join(self._rows).encode("utf-8")
+        self._rows = []
+        with pending_lock(), open(self.path, "ab+") as f:
+            # Never glue a row onto a torn line left by a crashed writer
+            end = f.seek(0, 2)
+            if end:
+                f.seek(end - 1)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+            f.write(data)
+
+    def flush(self) -> int:
+        """Append every staged row to tokens.csv in one write. Returns the row count.
+
+        Lines that aren't a JSON object are moved to tokens.pending.rejected.jsonl
+        rather than dropped. The staging file is only removed once its rows are in
+        tokens.csv, so a crash in between can duplicate rows but never lose them.
+        """
+        self.close()
+        # tokens.pending.flushing is left behind by older versions that crashed mid-flush
+        flushing = self.path.with_suffix(".flushing")
+        with pending_lock():
+            batch = []
+            rejected = []
+            for path in (flushing, self.path):
+                if not path.exists():
+                    continue
+                with open(path, "r", buffering=1 << 20) as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        try:
+                            row = json.loads(line)
+                        except ValueError:
+                            row = None
+                        if isinstance(row, dict):
+                            batch.append(row)
+                        else:
+                            rejected.append(line if line.endswith("\n") else line + "\n")
+
+            if rejected:
+                with open(REJECTED_PATH, "a") as f:
+                    f.write("".join(rejected))
+                print(f"Moved {len(rejected)} unreadable staged lines to {REJECTED_PATH.name}",
+                      file=sys.stderr)
+
+            if batch:
+                ensure_csv_exists()
+                with open(CSV_PATH, "a", newline="", buffering=1 << 16) as f:
+                    # csv.DictWriter filled missing keys with ""
+                    f.write("".join([
+                        format_row({column: row.get(column, "") for column in COLUMNS})
+                        for row in batch
+                    ]))
+
+            flushing.unlink(missing_ok=True)
+            self.path.unlink(missing_ok=True)
+        return len(batch)
+
+
+METRICS_BUFFER = MetricsBuffer()
+
+
 def label_existing_row(agent_id: str, agent_type: str, task_id: str, description: str):
     """Find an auto-captured row by agent_id and fill in the blank label fields.
 
@@ -56,7 +189,7 @@ def label_existing_row(agent_id: str, agent_type: str, task_id: str, description
     if not CSV_PATH.exists():
         return False
 
-    with open(CSV_PATH, "r", newline="") as f:
+    with open(CSV_PATH, "r", newline="", buffering=1 << 20) as f:
         reader = csv.DictReader(f)
         rows = list(reader)
 
@@ -85,10 +218,13 @@ def label_existing_row(agent_id: str, agent_type: str, task_id: str, description
             break
 
     if updated:
-        with open(CSV_PATH, "w", newline="") as f:
+        with open(CSV_PATH, "w", newline="", buffering=1 << 16) as f:
             writer = csv.DictWriter(f, fieldnames=COLUMNS)
             writer.writeheader()
             writer.writerows(rows)
+        # Byte offsets in sum_effort's task index and the summary cache are stale after a rewrite
+        INDEX_PATH.unlink(missing_ok=True)
+        SUMMARY_CACHE_PATH.unlink(missing_ok=True)
 
     return updated
 
@@ -106,9 +242,14 @@ def log_metrics(
     session_id: str = "",
     agent_id: str = "",
     started_at: str = "",
-    ended_at: str = ""
+    ended_at: str = "",
+    buffered: bool = False
 ):
-    """Append a metrics row to tokens.csv, or label an existing auto-captured row."""
+    """Append a metrics row to tokens.csv, or label an existing auto-captured row.
+
+    With buffered=True the row is staged via METRICS_BUFFER instead of being
+    appended to tokens.csv directly.
+    """
     ensure_csv_exists()
 
     # If agent_id provided, try to label an existing auto-captured row first
@@ -138,11 +279,13 @@ def log_metrics(
         "ended_at": ended_at
     }
 
-    with open(CSV_PATH, "a", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=COLUMNS)
-        writer.writerow(row)
+    if buffered:
+        METRICS_BUFFER.append(row)
+    else:
+        with open(CSV_PATH, "a", newline="", buffering=1 << 16) as f:
+            f.write(format_row(row))
 
-    print(f"Logged metrics for {agent_type}")
+    print(f"{'Buffered' if buffered else 'Logged'} metrics for {agent_type}")
     print(f"  Task: {task_id or '(none)'}")
     print(f"  Description: {description or '(none)'}")
     print(f"  Tokens: {total_tokens:,} total ({input_tokens:,} in, {output_tokens:,} out)")
@@ -150,40 +293,106 @@ def log_metrics(
         print(f"  Duration: {duration_secs}s")
 
 
+def read_summary_cache():
+    """Load tokens.summary.json, or None if it is missing or unreadable."""
+    try:
+        with open(SUMMARY_CACHE_PATH, "r") as f:
+            cache = json.load(f)
+        cache["fingerprint"] = bytes.fromhex(cache["fingerprint"])
+        return cache
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def write_summary_cache(cache):
+    """Save the summary cache, replacing the old one atomically; skipped if it can't be written."""
+    tmp = SUMMARY_CACHE_PATH.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp, "w") as f:
+            json.dump({**cache, "fingerprint": cache["fingerprint"].hex()}, f)
+        os.replace(tmp, SUMMARY_CACHE_PATH)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+
+
+def add_to_summary(by_type, rows, type_col, tokens_col):
+    """Count rows (field lists) into by_type: agent type -> [entries, tokens]."""
+    for fields in rows:
+        if not fields:
+            continue
+        agent_type = fields[type_col] if type_col is not None and type_col < len(fields) else None
+        # A handful of distinct types: share one string object (and its cached hash) each
+        agent_type = sys.intern(agent_type or "unknown")
+        total = fields[tokens_col] if tokens_col is not None and tokens_col < len(fields) else None
+        try:
+            total = int(total or 0)
+        except ValueError:
+            total = 0
+        stats = by_type.get(agent_type)
+        if stats is None:
+            by_type[agent_type] = [1, total]
+        else:
+            stats[0] += 1
+            stats[1] += total
+
+
 def show_summary():
-    """Show summary of logged metrics."""
+    """Show summary of logged metrics.
+
+    Per-type totals for the complete rows are kept in tokens.summary.json with
+    the byte offset they cover, so each run only parses rows appended since.
+    """
     if not CSV_PATH.exists():
         print("No metrics file found.")
         return
 
-    with open(CSV_PATH, "r") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-
-    if not rows:
+    with open(CSV_PATH, "rb", buffering=1 << 20) as f:
+        first = next(iter_rows_with_offsets(f, 0), None)
+        if first is None:
+            print("No metrics logged yet.")
+            return
+        _, header_end, header = first
+        positions = column_positions(header)
+        type_col = positions.get("agent_type")
+        tokens_col = positions.get("total_tokens")
+
+        cache = read_summary_cache()
+        size = f.seek(0, 2)
+        if (cache is None or cache.get("header") != header or cache["covered"] > size
+                or fingerprint(f, cache["covered"]) != cache["fingerprint"]):
+            cache = {"header": header, "covered": header_end, "by_type": {}}
+        cached_end = cache["covered"] if "fingerprint" in cache else None
+
+        # Fold in the rows appended since the cache was written
+        covered = cache["covered"]
+        by_type = cache["by_type"]
+        new_rows = []
+        for _, end, fields in iter_rows_with_offsets(f, covered):
+            covered = end
+            new_rows.append(fields)
+        add_to_summary(by_type, new_rows, type_col, tokens_col)
+
+        if covered != cached_end:
+            cache["covered"] = covered
+            cache["fingerprint"] = fingerprint(f, covered)
+            write_summary_cache(cache)
+
+        # An unterminated last line is shown but left out of the cache
+        add_to_summary(by_type, read_tail_rows(f, covered), type_col, tokens_col)
+
+    entries = sum(count for count, _ in by_type.values())
+    if not entries:
         print("No metrics logged yet.")
         return
 
-    # Summary by agent type
-    by_type = {}
-    for row in rows:
-        agent_type = row.get("agent_type") or "unknown"
-        if agent_type not in by_type:
-            by_type[agent_type] = {"count": 0, "tokens": 0}
-        by_type[agent_type]["count"] += 1
-        try:
-            by_type[agent_type]["tokens"] += int(row.get("total_tokens") or 0)
-        except ValueError:
-            pass
-
-    print(f"\nMetrics Summary ({len(rows)} entries)")
+    print(f"\nMetrics Summary ({entries} entries)")
     print("-" * 40)
-    for agent_type, stats in sorted(by_type.items()):
-        print(f"  {agent_type:12} {stats['count']:4} entries  {stats['tokens']:>12,} tokens")
+    for agent_type, (count, tokens) in sorted(by_type.items()):
+        print(f"  {agent_type:12} {count:4} entries  {tokens:>12,} tokens")
 
-    total_tokens = sum(s["tokens"] for s in by_type.values())
+    total_tokens = sum(tokens for _, tokens in by_type.values())
     print("-" * 40)
-    print(f"  {'TOTAL':12} {len(rows):4} entries  {total_tokens:>12,} tokens")
+    print(f"  {'TOTAL':12} {entries:4} entries  {total_tokens:>12,} tokens")
 
 
 def main():
@@ -200,6 +409,9 @@ def main():
     parser.add_argument("--session-id", default="", help="Session ID")
     parser.add_argument("--agent-id", default="", help="Agent ID")
     parser.add_argument("--summary", "-s", action="store_true", help="Show metrics summary")
+    parser.add_argument("--buffer", "-b", action="store_true",
+                        help="Stage the row in tokens.pending.jsonl (also MAD_METRICS_BUFFER=1)")
+    parser.add_argument("--flush", action="store_true", help="Move staged rows into tokens.csv")
 
     args = parser.parse_args()
 
@@ -207,6 +419,10 @@ def main():
         show_summary()
         return
 
+    if args.flush:
+        print(f"Flushed {METRICS_BUFFER.flush()} buffered metrics rows")
+        return
+
     if not args.agent_type:
         parser.error("--agent-type is required (or use --summary)")
 
@@ -221,7 +437,8 @@ def main():
         api_calls=args.api_calls,
         duration_secs=args.duration,
         session_id=args.session_id,
-        agent_id=args.agent_id
+        agent_id=args.agent_id,
+        buffered=args.buffer or os.environ.get("MAD_METRICS_BUFFER") == "1"
     )
 
 
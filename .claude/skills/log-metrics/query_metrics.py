@@ -7,17 +7,22 @@ Usage:
     python query_metrics.py --agent-type engineer
     python query_metrics.py --since 2026-01-30
     python query_metrics.py --task TASK-1234 --json
+    python query_metrics.py --task TASK-1234 --json --pretty
 
-All filters can be combined.
+All filters can be combined. JSON output is compact unless --pretty is given.
 """
 
 import argparse
 import csv
 import json
+import mmap
+import re
 import sys
 from datetime import datetime
 from pathlib import Path
 
+from csv_offsets import BARE_CR_RE
+
 METRICS_DIR = Path(__file__).parent.parent.parent / "metrics"
 CSV_PATH = METRICS_DIR / "tokens.csv"
 
@@ -41,79 +46,174 @@ COLUMNS = [
 ]
 
 
-def load_metrics():
-    """Load all rows from tokens.csv."""
-    if not CSV_PATH.exists():
-        return []
-
-    with open(CSV_PATH, "r") as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+# Timestamps as written by log_metrics and the SubagentStop hook. These sort
+# lexically in time order, so they can be compared as plain strings.
+ISO_UTC_RE = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z")
 
+# Filters that test a single column: filter name -> (column, prefix match?)
+COLUMN_FILTERS = {
+    "task": ("task_id", False),
+    "task_prefix": ("task_id", True),
+    "agent_type": ("agent_type", False),
+    "session_id": ("session_id", False),
+    "agent_id": ("agent_id", False),
+}
 
-def filter_rows(rows, task=None, task_prefix=None, agent_type=None,
-                session_id=None, agent_id=None, since=None, until=None):
-    """Filter rows based on criteria."""
-    result = []
-
-    for row in rows:
-        # Task filter (exact match)
-        if task and row.get("task_id") != task:
-            continue
-
-        # Task prefix filter (e.g., TASK-17 matches TASK-1775, TASK-1776)
-        if task_prefix and not (row.get("task_id") or "").startswith(task_prefix):
-            continue
+# Any data line with at least one character (blank lines are not rows)
+NON_BLANK_LINE_RE = re.compile(rb"^(?!\r?$)", re.M)
 
-        # Agent type filter
-        if agent_type and row.get("agent_type") != agent_type:
-            continue
 
-        # Session ID filter
-        if session_id and row.get("session_id") != session_id:
-            continue
-
-        # Agent ID filter
-        if agent_id and row.get("agent_id") != agent_id:
-            continue
-
-        # Date filters
-        timestamp = row.get("timestamp", "")
-        if timestamp:
-            try:
-                row_date = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-
-                if since:
-                    since_date = datetime.fromisoformat(since + "T00:00:00+00:00")
-                    if row_date < since_date:
-                        continue
-
-                if until:
-                    until_date = datetime.fromisoformat(until + "T23:59:59+00:00")
-                    if row_date > until_date:
-                        continue
-            except (ValueError, TypeError):
-                pass
+def load_metrics(**filters):
+    """Stream rows from tokens.csv, applying filters while reading.
 
-        result.append(row)
+    Filters are pushed down into the read loop so rows that don't match are
+    never retained. Accepts the same keyword filters as build_filter().
+    """
+    if not CSV_PATH.exists():
+        return
 
-    return result
+    with open(CSV_PATH, "r", buffering=1 << 20) as f:
+        reader = csv.DictReader(f)
+        yield from filter_rows(reader, **filters)
+
+
+def count_metrics(**filters):
+    """Count the rows load_metrics() would yield for the same filters."""
+    count = scan_count({name: value for name, value in filters.items() if value})
+    if count is None:
+        count = sum(1 for _ in load_metrics(**filters))
+    return count
+
+
+def scan_count(active):
+    """Count matching rows with a regex over the raw file, skipping the CSV parser.
+
+    Only handles no filter or a single column filter, and only files where every
+    line is exactly one row: no quoted fields and no bare CR line breaks. Returns
+    None whenever that doesn't hold, so the caller falls back to full parsing.
+    """
+    if len(active) > 1 or not active.keys() <= COLUMN_FILTERS.keys():
+        return None
+    if not CSV_PATH.exists() or CSV_PATH.stat().st_size == 0:
+        return None
+
+    with open(CSV_PATH, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm.find(b'"') != -1 or BARE_CR_RE.search(mm):
+            return None
+        header_end = mm.find(b"\n") + 1
+        if header_end == 0:
+            # Header only
+            return 0
+
+        if not active:
+            pattern = NON_BLANK_LINE_RE
+        else:
+            (name, value), = active.items()
+            column, prefix = COLUMN_FILTERS[name]
+            header = mm[:header_end].decode("utf-8").rstrip("\r\n").split(",")
+            needle = value.encode("utf-8")
+            if header.count(column) != 1 or any(c in needle for c in b',"\r\n'):
+                return None
+            # Skip to the column by position, then match the value (to the field end)
+            pattern = re.compile(
+                rb"^(?:[^,\n]*,){%d}" % header.index(column)
+                + re.escape(needle)
+                + (b"" if prefix else rb"(?=,|\r?$)"),
+                re.M,
+            )
+        return len(pattern.findall(mm, header_end))
+
+
+def filter_rows(rows, **filters):
+    """Return an iterator over the rows that match all given criteria."""
+    return filter(build_filter(**filters), rows)
+
+
+def build_filter(task=None, task_prefix=None, agent_type=None,
+                 session_id=None, agent_id=None, since=None, until=None):
+    """Compile a row predicate that tests only the filters actually set.
+
+    The set of active filters is fixed for a run, so instead of re-checking
+    every "if task and ..." per row, the predicate is generated once as a
+    single expression. Filter values are embedded with repr().
+    """
+    terms = []
+    # Task filter (exact match)
+    if task:
+        terms.append(f"row.get('task_id') == {task!r}")
+    # Task prefix filter (e.g., TASK-17 matches TASK-1775, TASK-1776)
+    if task_prefix:
+        terms.append(f"(row.get('task_id') or '').startswith({task_prefix!r})")
+    if agent_type:
+        terms.append(f"row.get('agent_type') == {agent_type!r}")
+    if session_id:
+        terms.append(f"row.get('session_id') == {session_id!r}")
+    if agent_id:
+        terms.append(f"row.get('agent_id') == {agent_id!r}")
+    if since or until:
+        terms.append("in_range(row.get('timestamp', ''))")
+
+    source = "lambda row: " + (" and ".join(terms) or "True")
+    return eval(compile(source, "<filter>", "eval"), {"in_range": date_filter(since, until)})
+
+
+def date_filter(since=None, until=None):
+    """Return a check for whether a timestamp falls within [since, until].
+
+    Missing or unparseable timestamps pass, as they always have.
+    """
+    # Date bounds are loop invariants: build them once, not per row
+    since_date = datetime.fromisoformat(since + "T00:00:00+00:00") if since else None
+    until_date = datetime.fromisoformat(until + "T23:59:59+00:00") if until else None
+    # Canonical strings come from the parsed dates, so inputs like 20260301 or
+    # 2026-W10-1 (which fromisoformat also accepts) compare correctly
+    since_str = since_date.strftime("%Y-%m-%dT%H:%M:%SZ") if since else None
+    until_str = until_date.strftime("%Y-%m-%dT%H:%M:%SZ") if until else None
+
+    def in_range(timestamp):
+        if not timestamp:
+            return True
+        if ISO_UTC_RE.fullmatch(timestamp):
+            # Canonical form: a string compare gives the same answer as datetimes
+            if since_str and timestamp < since_str:
+                return False
+            if until_str and timestamp > until_str:
+                return False
+            return True
+        try:
+            row_date = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+            if since_date and row_date < since_date:
+                return False
+
+            if until_date and row_date > until_date:
+                return False
+        except (ValueError, TypeError):
+            pass
+        return True
+
+    return in_range
 
 
 def output_csv(rows):
     """Output rows as CSV."""
-    if not rows:
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
         print("No matching entries found.", file=sys.stderr)
         return
 
     writer = csv.DictWriter(sys.stdout, fieldnames=COLUMNS)
     writer.writeheader()
+    writer.writerow(first)
     for row in rows:
         writer.writerow(row)
 
 
-def output_json(rows):
-    """Output rows as JSON."""
+def output_json(rows, pretty=False):
+    """Output rows as JSON, compact unless pretty."""
+    rows = list(rows)
+
     # Convert numeric fields
     for row in rows:
         for field in ["input_tokens", "output_tokens", "cache_read", "cache_create",
@@ -123,7 +223,10 @@ def output_json(rows):
             except (ValueError, TypeError):
                 row[field] = 0
 
-    print(json.dumps(rows, indent=2))
+    if pretty:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(json.dumps(rows, separators=(",", ":")))
 
 
 def main():
@@ -135,7 +238,7 @@ Examples:
   %(prog)s --task TASK-1775
   %(prog)s --agent-type engineer --since 2026-01-30
   %(prog)s --task-prefix TASK-17 --json
-  %(prog)s --session-id abc123 --json
+  %(prog)s --session-id abc123 --json --pretty
         """
     )
 
@@ -151,13 +254,18 @@ Examples:
     # Output format
     parser.add_argument("--json", "-j", action="store_true", help="Output as JSON")
     parser.add_argument("--count", "-c", action="store_true", help="Only show count of matches")
+    parser.add_argument("--pretty", "-p", action="store_true", help="Pretty print JSON output")
 
     args = parser.parse_args()
 
-    # Load and filter
-    rows = load_metrics()
-    filtered = filter_rows(
-        rows,
+    for flag, value in (("--since", args.since), ("--until", args.until)):
+        if value:
+            try:
+                datetime.fromisoformat(value + "T00:00:00+00:00")
+            except ValueError:
+                parser.error(f"{flag} must be a date in YYYY-MM-DD format")
+
+    filters = dict(
         task=args.task,
         task_prefix=args.task_prefix,
         agent_type=args.agent_type,
@@ -167,11 +275,16 @@ Examples:
         until=args.until
     )
 
-    # Output
     if args.count:
-        print(len(filtered))
-    elif args.json:
-        output_json(filtered)
+        print(count_metrics(**filters))
+        return
+
+    # Load with filters pushed down into the read
+    filtered = load_metrics(**filters)
+
+    # Output
+    if args.json:
+        output_json(filtered, args.pretty)
     else:
         output_csv(filtered)
 
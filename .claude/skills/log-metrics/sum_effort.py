@@ -8,63 +8,401 @@ Usage:
     python sum_effort.py --task TASK-1234
     python sum_effort.py --task-prefix TASK-17
     python sum_effort.py --session-id abc123
+
+--task and --task-prefix lookups go through tokens.taskidx, a task_id -> byte
+offset index that is brought up to date on each lookup, so only matching rows
+are parsed. Other selectors scan the file, split across worker processes once
+it passes PARALLEL_MIN_BYTES.
 """
 
 import argparse
 import csv
 import json
+import mmap
+import os
 import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from operator import itemgetter
 from pathlib import Path
 
+from csv_offsets import BARE_CR_RE, column_positions, fingerprint, iter_rows_with_offsets, read_tail_rows
+
 METRICS_DIR = Path(__file__).parent.parent.parent / "metrics"
 CSV_PATH = METRICS_DIR / "tokens.csv"
+INDEX_PATH = METRICS_DIR / "tokens.taskidx"
 
+# A task prefix matching over 1/INDEX_SCAN_SHARE of all rows is scanned for
+# instead: reading the file straight through beats seeking to each row
+INDEX_SCAN_SHARE = 4
 
-def load_metrics():
-    """Load all rows from tokens.csv."""
-    if not CSV_PATH.exists():
-        return []
+# tokens.csv size from which selector scans are split across processes
+PARALLEL_MIN_BYTES = 64 << 20
+
+NUMERIC_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_read",
+    "cache_create",
+    "billable_tokens",
+    "total_tokens",
+    "api_calls",
+    "duration_secs",
+)
+
+# Fields kept per matched row; everything else in a row is dropped on read
+COLUMN_FIELDS = ("agent_id",) + NUMERIC_FIELDS
+
+# Matched rows held before they are folded into the running totals
+FOLD_ROWS = 4096
 
-    with open(CSV_PATH, "r") as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+
+def load_metrics(column, value, prefix=False, parallel=True):
+    """Sum the rows of tokens.csv where column matches value, in one pass.
+
+    Rows are read as plain field lists and matched by position, so no per-row
+    dict is built. Matches are folded into the running summary every FOLD_ROWS
+    rows, so memory stays bounded however many rows match. Returns None if the
+    file is missing or has no rows at all.
+    """
+    if not CSV_PATH.exists():
+        return None
+    if parallel and CSV_PATH.stat().st_size >= PARALLEL_MIN_BYTES and (os.cpu_count() or 1) > 1:
+        return load_metrics_parallel(column, value, prefix)
+
+    summary = new_summary()
+    matched = []
+    seen_any = False
+    with open(CSV_PATH, "r", buffering=1 << 20) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return None
+        width = len(header)
+        pick_fields = field_picker(header)
+        predicate = build_predicate(column_positions(header).get(column), value, prefix)
+
+        for fields in reader:
+            if not fields:
+                continue
+            seen_any = True
+            if len(fields) < width:
+                fields += [None] * (width - len(fields))
+            if predicate(fields):
+                matched.append(pick_fields(fields))
+                if len(matched) >= FOLD_ROWS:
+                    add_rows(summary, matched)
+                    matched.clear()
+
+    add_rows(summary, matched)
+    return summary if seen_any else None
+
+
+def load_metrics_parallel(column, value, prefix):
+    """load_metrics() for large files: scan byte ranges of tokens.csv in worker processes.
+
+    Range boundaries are snapped to line starts, which may land inside a quoted
+    multi-line field. Each worker reports where its last row ended; if that
+    isn't where the next range starts, the split was wrong and the file is
+    scanned sequentially instead.
+    """
+    with open(CSV_PATH, "rb") as f:
+        first = next(iter_rows_with_offsets(f, 0), None)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            bare_cr = BARE_CR_RE.search(mm) is not None
+        if first is None or bare_cr:
+            return load_metrics(column, value, prefix, parallel=False)
+        _, header_end, header = first
+
+        size = f.seek(0, 2)
+        workers = os.cpu_count()
+        starts = [header_end]
+        for k in range(1, workers):
+            f.seek(header_end + (size - header_end) * k // workers)
+            f.readline()
+            if starts[-1] < f.tell() < size:
+                starts.append(f.tell())
+
+    with ProcessPoolExecutor(len(starts)) as pool:
+        results = list(pool.map(
+            scan_range, repeat(header), repeat(column), repeat(value), repeat(prefix),
+            starts, starts[1:] + [None]
+        ))
+
+    if any(stop != next_start for (*_, stop), next_start in zip(results, starts[1:])):
+        return load_metrics(column, value, prefix, parallel=False)
+    if not any(seen_any for _, seen_any, _ in results):
+        return None
+
+    summary = new_summary()
+    for partial, _, _ in results:
+        merge_summary(summary, partial)
+    return summary
+
+
+def scan_range(header, column, value, prefix, start, end):
+    """Worker for load_metrics_parallel: match the rows starting in [start, end).
+
+    With end=None the range runs to EOF, unterminated last line included.
+    Returns (summary, seen_any, stop), stop being the offset where the last
+    row in the range ended.
+    """
+    width = len(header)
+    pick_fields = field_picker(header)
+    predicate = build_predicate(column_positions(header).get(column), value, prefix)
+    summary = new_summary()
+    matched = []
+    seen_any = False
+
+    def take(fields):
+        nonlocal seen_any
+        if not fields:
+            return
+        seen_any = True
+        if len(fields) < width:
+            fields += [None] * (width - len(fields))
+        if predicate(fields):
+            matched.append(pick_fields(fields))
+            if len(matched) >= FOLD_ROWS:
+                add_rows(summary, matched)
+                matched.clear()
+
+    stop = start
+    with open(CSV_PATH, "rb", buffering=1 << 20) as f:
+        for row_start, row_end, fields in iter_rows_with_offsets(f, start):
+            if end is not None and row_start >= end:
+                break
+            stop = row_end
+            take(fields)
+        else:
+            if end is None:
+                for fields in read_tail_rows(f, stop):
+                    take(fields)
+
+    add_rows(summary, matched)
+    return summary, seen_any, stop
+
+
+def field_picker(header):
+    """itemgetter pulling COLUMN_FIELDS, in order, out of a row's field list.
+
+    Fields missing from the header (older tokens.csv layouts) read as None, as
+    row.get() did on csv.DictReader rows.
+    """
+    positions = column_positions(header)
+    if all(field in positions for field in COLUMN_FIELDS):
+        return itemgetter(*[positions[field] for field in COLUMN_FIELDS])
+    picks = [positions.get(field) for field in COLUMN_FIELDS]
+    return lambda fields: tuple(None if position is None else fields[position] for position in picks)
+
+
+def to_columns(matched):
+    """Transpose picked row tuples into one column per COLUMN_FIELDS entry.
+
+    Numeric columns become array('q') so summing them is a single C loop over
+    contiguous int64s rather than a walk over per-row dicts.
+    """
+    columns = dict(zip(COLUMN_FIELDS, zip(*matched))) if matched else dict.fromkeys(COLUMN_FIELDS, ())
+    for field in NUMERIC_FIELDS:
+        columns[field] = int_column(columns[field])
+    return columns
+
+
+def new_summary():
+    """Empty running summary: per-field totals, distinct agent_ids, row count."""
+    return {"totals": dict.fromkeys(NUMERIC_FIELDS, 0), "agent_ids": set(), "entries": 0}
+
+
+def add_rows(summary, matched):
+    """Fold a batch of picked row tuples into summary."""
+    if not matched:
+        return
+    columns = to_columns(matched)
+    totals = summary["totals"]
+    for field in NUMERIC_FIELDS:
+        totals[field] += sum(columns[field])
+    summary["agent_ids"].update(columns["agent_id"])
+    summary["entries"] += len(matched)
+
+
+def merge_summary(summary, other):
+    """Fold another summary into summary."""
+    totals = summary["totals"]
+    for field in NUMERIC_FIELDS:
+        totals[field] += other["totals"][field]
+    summary["agent_ids"] |= other["agent_ids"]
+    summary["entries"] += other["entries"]
+
+
+def read_task_index(task_id, prefix=False):
+    """Scan tokens.taskidx for task_id, or for every task_id starting with it if prefix.
+
+    Returns (offsets, covered, row_count, fingerprint) from the last checkpoint,
+    or None when there is no usable index. Index lines are "task_id<TAB>offset";
+    checkpoint lines are "#<TAB>covered<TAB>row_count<TAB>fingerprint_hex".
+    """
+    if not INDEX_PATH.exists():
+        return None
+
+    offsets = []
+    checkpoint = None
+    try:
+        with open(INDEX_PATH, "r", buffering=1 << 20) as f:
+            for line in f:
+                key, _, rest = line.rstrip("\n").partition("\t")
+                if key == "#":
+                    covered, row_count, fingerprint = rest.split("\t")
+                    checkpoint = (int(covered), int(row_count), bytes.fromhex(fingerprint))
+                elif key == task_id or (prefix and key.startswith(task_id)):
+                    offsets.append(int(rest))
+    except ValueError:
+        # Torn or hand-edited line: treat the index as unusable
+        return None
+    except OSError:
+        return None
+
+    if checkpoint is None:
+        return None
+    covered = checkpoint[0]
+    # Concurrent updaters may both append the same entries, and entries past
+    # the last checkpoint (a torn write, or an older checkpoint landing last)
+    # are found again by the catch-up scan; sorted offsets keep reads moving
+    # forward through the file
+    return sorted({offset for offset in offsets if offset < covered}), *checkpoint
+
+
+def load_task_rows(task_id, prefix=False, rebuild=False):
+    """Sum the rows for one task (or task prefix) via the task_id -> byte offset index.
+
+    Rows appended since the last lookup (by log_metrics or the SubagentStop hook)
+    are indexed first. The index is rebuilt if the CSV no longer matches the part
+    it covers, e.g. after label_existing_row rewrote the file. Returns None if the
+    file is missing or has no rows at all.
+    """
+    if not CSV_PATH.exists():
+        return None
+
+    # Default buffer size here: lookups seek around and read one row at a time
+    with open(CSV_PATH, "rb") as f:
+        first = next(iter_rows_with_offsets(f, 0), None)
+        if first is None:
+            return None
+        _, header_end, header = first
+        if "task_id" not in header:
+            # Nothing to index: no row can match
+            return load_metrics("task_id", task_id, prefix)
+        task_col = column_positions(header)["task_id"]
+        if prefix:
+            matches = lambda value: value.startswith(task_id)
+        else:
+            matches = task_id.__eq__
+
+        index = None if rebuild else read_task_index(task_id, prefix)
+        if index is not None:
+            offsets, covered, row_count, tail = index
+            f.seek(0, 2)
+            if covered > f.tell() or fingerprint(f, covered) != tail:
+                index = None
+        # An index that can't be written is skipped, not an error
+        persist = True
+        if index is None:
+            try:
+                INDEX_PATH.unlink(missing_ok=True)
+            except OSError:
+                persist = False
+            offsets, covered, row_count = [], header_end, 0
+
+        # Index whatever was appended after the last checkpoint
+        new_entries = []
+        for start, end, fields in iter_rows_with_offsets(f, covered):
+            if not fields:
+                covered = end
+                continue
+            row_count += 1
+            covered = end
+            row_task = fields[task_col] if len(fields) > task_col else ""
+            if row_task:
+                new_entries.append(f"{row_task}\t{start}\n")
+            if row_task and matches(row_task):
+                offsets.append(start)
+
+        if persist and (new_entries or index is None or covered != index[1]):
+            checkpoint = f"#\t{covered}\t{row_count}\t{fingerprint(f, covered).hex()}\n"
+            try:
+                with open(INDEX_PATH, "a") as idx:
+                    idx.write("".join(new_entries) + checkpoint)
+            except OSError:
+                pass
+
+        # An unterminated last line stays out of the index but still counts,
+        # as it would for a full csv.DictReader pass
+        tail_rows = read_tail_rows(f, covered)
+        row_count += len(tail_rows)
+
+        if row_count == 0:
+            return None
+        if prefix and len(offsets) * INDEX_SCAN_SHARE > row_count:
+            return load_metrics("task_id", task_id, prefix=True)
+
+        # Short rows are padded with None, as csv.DictReader would fill them
+        width = len(header)
+        pick_fields = field_picker(header)
+        matched = [
+            pick_fields(fields + [None] * (width - len(fields))) for fields in tail_rows
+            if len(fields) > task_col and matches(fields[task_col])
+        ]
+        summary = new_summary()
+        for offset in offsets:
+            _, _, fields = next(iter_rows_with_offsets(f, offset))
+            if len(fields) <= task_col or not matches(fields[task_col]):
+                # Offsets no longer line up with rows: start the index over,
+                # or scan if the file changed again under the rebuild
+                if rebuild:
+                    return load_metrics("task_id", task_id, prefix)
+                return load_task_rows(task_id, prefix, rebuild=True)
+            matched.append(pick_fields(fields + [None] * (width - len(fields))))
+            if len(matched) >= FOLD_ROWS:
+                add_rows(summary, matched)
+                matched.clear()
+
+    add_rows(summary, matched)
+    return summary
 
 
 def safe_int(value):
     """Convert value to int, defaulting to 0."""
+    # Plain digit strings (nearly all of them) skip the exception machinery
+    if value and value.isdecimal():
+        return int(value)
     try:
         return int(value or 0)
     except (ValueError, TypeError):
         return 0
 
 
-def aggregate_rows(rows, identifier_field, identifier_value):
-    """Aggregate metrics from rows."""
-    totals = {
-        "input_tokens": 0,
-        "output_tokens": 0,
-        "cache_read": 0,
-        "cache_create": 0,
-        "billable_tokens": 0,
-        "total_tokens": 0,
-        "api_calls": 0,
-        "duration_secs": 0,
-    }
-
-    agent_sessions = set()
-    entries = 0
+def int_column(values):
+    """Parse a column of CSV strings into an int64 array, treating blanks and junk as 0."""
+    try:
+        # Whole-column int parse runs in C; most columns are clean
+        return array("q", map(int, values))
+    except (ValueError, TypeError, OverflowError):
+        pass
+    parsed = list(map(safe_int, values))
+    try:
+        return array("q", parsed)
+    except OverflowError:
+        # Out of int64 range: a plain list still sums exactly
+        return parsed
 
-    for row in rows:
-        entries += 1
 
-        # Aggregate numeric fields
-        for field in totals:
-            totals[field] += safe_int(row.get(field))
+def aggregate_rows(summary, identifier_field, identifier_value):
+    """Build the output record from a summary."""
+    totals = summary["totals"]
 
-        # Track unique agent sessions
-        agent_id = row.get("agent_id")
-        if agent_id:
-            agent_sessions.add(agent_id)
+    agent_sessions = set(summary["agent_ids"])
+    agent_sessions.discard(None)
+    agent_sessions.discard("")
 
     return {
         identifier_field: identifier_value,
@@ -77,28 +415,29 @@ def aggregate_rows(rows, identifier_field, identifier_value):
         "api_calls": totals["api_calls"],
         "duration_secs": totals["duration_secs"],
         "agent_sessions": len(agent_sessions),
-        "entries": entries
+        "entries": summary["entries"]
     }
 
 
-def filter_by_task(rows, task_id):
-    """Filter rows by exact task ID match."""
-    return [r for r in rows if r.get("task_id") == task_id]
-
+# One row per selector flag: (argparse dest, column to match, output key, prefix match?)
+QUERIES = (
+    ("task", "task_id", "task_id", False),
+    ("task_prefix", "task_id", "task_prefix", True),
+    ("session_id", "session_id", "session_id", False),
+    ("agent_id", "agent_id", "agent_id", False),
+)
 
-def filter_by_task_prefix(rows, prefix):
-    """Filter rows by task ID prefix."""
-    return [r for r in rows if (r.get("task_id") or "").startswith(prefix)]
 
+def build_predicate(position, value, prefix=False):
+    """Predicate on a row's field list: field == value, or startswith if prefix.
 
-def filter_by_session(rows, session_id):
-    """Filter rows by session ID."""
-    return [r for r in rows if r.get("session_id") == session_id]
-
-
-def filter_by_agent(rows, agent_id):
-    """Filter rows by agent ID."""
-    return [r for r in rows if r.get("agent_id") == agent_id]
+    position is None when the column isn't in the header; then nothing matches.
+    """
+    if position is None:
+        return lambda fields: False
+    if prefix:
+        return lambda fields: (fields[position] or "").startswith(value)
+    return lambda fields: fields[position] == value
 
 
 def main():
@@ -134,26 +473,24 @@ Output (JSON):
 
     args = parser.parse_args()
 
-    # Load all rows
-    rows = load_metrics()
+    # Resolve the selector flag into a single column query
+    for option, column, identifier_field, prefix in QUERIES:
+        identifier_value = getattr(args, option)
+        if identifier_value:
+            break
+    else:
+        parser.error("the selected filter needs a non-empty value")
+
+    if column == "task_id":
+        summary = load_task_rows(identifier_value, prefix)
+    else:
+        summary = load_metrics(column, identifier_value, prefix)
 
-    if not rows:
+    if summary is None:
         print('{"error": "No metrics file found or empty"}', file=sys.stderr)
         sys.exit(1)
 
-    # Filter based on criteria
-    if args.task:
-        filtered = filter_by_task(rows, args.task)
-        result = aggregate_rows(filtered, "task_id", args.task)
-    elif args.task_prefix:
-        filtered = filter_by_task_prefix(rows, args.task_prefix)
-        result = aggregate_rows(filtered, "task_prefix", args.task_prefix)
-    elif args.session_id:
-        filtered = filter_by_session(rows, args.session_id)
-        result = aggregate_rows(filtered, "session_id", args.session_id)
-    elif args.agent_id:
-        filtered = filter_by_agent(rows, args.agent_id)
-        result = aggregate_rows(filtered, "agent_id", args.agent_id)
+    result = aggregate_rows(summary, identifier_field, identifier_value)
 
     # Output
     if args.pretty: